@@ -1,8 +1,8 @@
+import logging
 import os
 
 import click
 from genpydoc.config.config import Config
-from genpydoc.documenter import Documenter
 from genpydoc.utils.utils import read_config_file
 
 
@@ -99,6 +99,67 @@ from genpydoc.utils.utils import read_config_file
     show_default=True,
     help="Only run the evaluator on Git diffed Nodes.",
 )
+@click.option(
+    "--skip-if-documented",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help=(
+        "Do not prompt for Nodes whose docstring already uses the sections "
+        "of the selected style."
+    ),
+)
+@click.option(
+    "--use-batch-api",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Submit the prompts as a single OpenAI Batch API job.",
+)
+@click.option(
+    "--batch-threshold",
+    type=click.IntRange(min=1),
+    default=20,
+    show_default=True,
+    help=(
+        "Minimum number of prompts for which the Batch API is used; smaller "
+        "sets are sent concurrently."
+    ),
+)
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(min=1),
+    default=50,
+    show_default=True,
+    help="Maximum number of concurrent requests to the LLM provider.",
+)
+@click.option(
+    "--qpm",
+    type=click.IntRange(min=1),
+    default=500,
+    show_default=True,
+    help="Maximum number of requests per minute to the LLM provider.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help=(
+        "Do not reuse nor store LLM responses and extracted nodes in the "
+        "on-disk caches."
+    ),
+)
+@click.option(
+    "--cache-ttl-days",
+    type=click.IntRange(min=0),
+    default=30,
+    show_default=True,
+    help=(
+        "Number of days after which cached LLM responses and extracted "
+        "nodes are discarded; 0 keeps them forever."
+    ),
+)
 @click.option(
     "--use-llm-provider",
     type=click.Choice(["openai"]),
@@ -156,6 +217,13 @@ def main(
     ignore_overloaded_functions: bool,
     include_only_covered: bool,
     run_on_diff: bool,
+    skip_if_documented: bool,
+    use_batch_api: bool,
+    batch_threshold: int,
+    max_concurrency: int,
+    qpm: int,
+    no_cache: bool,
+    cache_ttl_days: int,
     use_llm_provider: str,
     use_model: str,
     style: str,
@@ -173,11 +241,22 @@ def main(
         ignore_overloaded_functions=ignore_overloaded_functions,
         include_only_covered=include_only_covered,
         run_on_diff=run_on_diff,
+        skip_if_documented=skip_if_documented,
+        use_batch_api=use_batch_api,
+        batch_threshold=batch_threshold,
+        max_concurrency=max_concurrency,
+        qpm=qpm,
+        use_cache=not no_cache,
+        cache_ttl_days=cache_ttl_days,
         use_llm_provider=use_llm_provider,
         use_model=use_model,
     )
     if not paths:
         paths = [os.path.abspath(os.getcwd())]
 
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # deferred so that `--help` and option errors do not pay for it
+    from genpydoc.documenter import Documenter
+
     doc = Documenter(config)
     doc.document(paths)
@@ -0,0 +1,63 @@
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable
+
+
+class PromptCache:
+    """Persistent cache of LLM responses, keyed by a hash of their prompt.
+
+    Attributes:
+        path (Path): Location of the SQLite database backing the cache.
+        ttl_days (int | None): Age, in days, after which a cached response
+            is discarded; never, if not set.
+    """
+
+    DEFAULT_PATH: Path = Path.home() / ".cache" / "genpydoc" / "cache.sqlite"
+
+    def __init__(
+        self, path: str | Path | None = None, ttl_days: int | None = None
+    ):
+        self.path = Path(path) if path else self.DEFAULT_PATH
+        self.ttl_days = ttl_days
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT, created REAL)"
+            )
+            if ttl_days:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created < ?",
+                    (time.time() - ttl_days * 86400,),
+                )
+
+    @staticmethod
+    def key(model: str, style: str, prompt: str) -> str:
+        """Hash a prompt; the model and docstring style are part of the key
+        so that changing either invalidates the cached responses."""
+        return hashlib.blake2b(
+            "\x00".join((model, style, prompt)).encode(), digest_size=16
+        ).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        row = self._conn.execute(
+            "SELECT response FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, response: str) -> None:
+        self.set_many({key: response}.items())
+
+    def set_many(self, items: Iterable[tuple[str, str]]) -> None:
+        """Store several responses in a single transaction, so that a run
+        commits (and syncs to disk) once rather than once per response."""
+        created = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO responses (key, response, created) "
+                "VALUES (?, ?, ?)",
+                ((key, response, created) for key, response in items),
+            )
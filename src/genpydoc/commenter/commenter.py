@@ -1,19 +1,179 @@
 import asyncio
+import functools
+import json
+import logging
 import os
 from pathlib import Path
 from timeit import default_timer as timer
 
+import httpx
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
 from openai import AsyncOpenAI as AsyncOpenAIClient
+from openai import APIConnectionError, InternalServerError, RateLimitError
+from openai import DefaultAsyncHttpxClient
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 from tqdm import tqdm
 
+from genpydoc.commenter.cache import PromptCache
 from genpydoc.commenter.transformer import Parser
 from genpydoc.config.config import Config
 from genpydoc.extractor.visit import CovNode
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+@functools.cache
+def openai_api_key() -> str | None:
+    """OpenAI API key, read once from the environment or a `.env` file."""
+    load_dotenv()
+    return os.getenv("OPENAI_API_KEY")
+
+
+RETRYABLE_ERRORS = (APIConnectionError, InternalServerError, RateLimitError)
+
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:  # orjson only speeds up the batch payloads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    _json_loads = json.loads
+
+
+class BatchProcessor:
+    """Submit a set of prompts as a single OpenAI Batch API job.
+
+    The prompts are serialized into an in-memory JSONL file, uploaded, and
+    processed by one batch job, which is polled with an exponential backoff
+    until it reaches a terminal status.
+
+    Attributes:
+        client (AsyncOpenAIClient): The client used to reach the API.
+        model (str): The model used for every request of the batch.
+        poll_interval (float): Initial delay, in seconds, between polls.
+        max_poll_interval (float): Upper bound of the polling delay.
+    """
+
+    ENDPOINT: str = "/v1/responses"
+    COMPLETION_WINDOW: str = "24h"
+    TERMINAL_STATUSES: tuple = ("completed", "failed", "expired", "cancelled")
+
+    def __init__(
+        self,
+        client: AsyncOpenAIClient,
+        model: str,
+        poll_interval: float = 5.0,
+        max_poll_interval: float = 60.0,
+    ):
+        self.client = client
+        self.model = model
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+
+    def build_input(self, prompts: dict[str, str]) -> bytes:
+        """Serialize the prompts into the JSONL payload of a batch; each
+        request is identified by the position of its prompt."""
+        lines = [
+            _json_dumps(
+                {
+                    "custom_id": str(i),
+                    "method": "POST",
+                    "url": self.ENDPOINT,
+                    "body": {"model": self.model, "input": prompt},
+                }
+            )
+            for i, prompt in enumerate(prompts.values())
+        ]
+        return b"\n".join(lines)
+
+    @staticmethod
+    def _output_text(body: dict) -> str:
+        """Concatenate the text parts of a raw Responses API body."""
+        return "".join(
+            part.get("text", "")
+            for item in body.get("output", [])
+            if item.get("type") == "message"
+            for part in item.get("content", [])
+            if part.get("type") == "output_text"
+        )
+
+    def parse_output(self, content: str) -> dict[str, str]:
+        """Map each `custom_id` of a batch output file to its text."""
+        responses = {}
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            result = _json_loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                tqdm.write(
+                    f"[error]: request {result.get('custom_id')} failed: "
+                    f"{result.get('error') or response.get('body')!r}"
+                )
+                continue
+            responses[result["custom_id"]] = self._output_text(
+                response["body"]
+            )
+        return responses
+
+    async def submit(self, prompts: dict[str, str]) -> str:
+        """Upload the prompts and create the batch job, returning its id."""
+        batch_file = await self.client.files.create(
+            file=("batch.jsonl", self.build_input(prompts)),
+            purpose="batch",
+        )
+        batch = await self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=self.ENDPOINT,
+            completion_window=self.COMPLETION_WINDOW,
+        )
+        return batch.id
+
+    async def wait(self, batch_id: str, total: int):
+        """Poll the batch job until it reaches a terminal status, reporting
+        the requests it has processed so far."""
+        delay = self.poll_interval
+        with tqdm(
+            total=total, desc="Commenting (batch)", unit="block", leave=True
+        ) as pbar:
+            while True:
+                batch = await self.client.batches.retrieve(batch_id)
+                counts = batch.request_counts
+                if counts is not None:
+                    pbar.update(counts.completed + counts.failed - pbar.n)
+                if batch.status in self.TERMINAL_STATUSES:
+                    return batch
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+
+    async def process(self, prompts: dict[str, str]) -> dict[str, str]:
+        """Run the prompts through a batch job and collect the responses.
+
+        Raises:
+            RuntimeError: If the batch ended without producing any output.
+        """
+        batch = await self.wait(await self.submit(prompts), len(prompts))
+        if not batch.output_file_id:
+            raise RuntimeError(
+                f"Batch {batch.id} ended with status '{batch.status}' "
+                "without output."
+            )
+        content = await self.client.files.content(batch.output_file_id)
+        names = list(prompts)
+        return {
+            names[int(custom_id)]: text
+            for custom_id, text in self.parse_output(content.text).items()
+        }
 
 
 class Commenter:
@@ -21,20 +181,86 @@ class Commenter:
         "openai": "gpt-5-nano",
     }
 
+    # sections showing that a docstring was written in a given style
+    STYLE_MARKERS: dict[str, tuple[str, ...]] = {
+        "google": ("Args:", "Returns:", "Attributes:"),
+        "numpy": ("Parameters\n", "Returns\n", "Attributes\n"),
+        "sphinx": (":param", ":return", ":ivar"),
+        "reST": (":param", ":return", ":ivar"),
+        "epytext": ("@param", "@return", "@ivar"),
+    }
+    MIN_DOCUMENTED_LENGTH: int = 40
+    # leading chunks of a streamed answer checked for an early "-1"
+    EARLY_EXIT_CHUNKS: int = 10
+
+    _DOCSTRING_PROMPT: str = (
+        "This is the current docstring between <doc.start> and <doc.end>:"
+        "\n\n<doc.start>\n{docstring}\n<doc.end>\n\n"
+    )
+    _CLASS_PROMPT: str = (
+        "You are a senior python engineer. Analyze the following class "
+        "between <code.start> and <code.end>:"
+        "\n\n<code.start>\n{code}\n<code.end>\n\n"
+        "{docstring}"
+        "I want you to analyze the purpose of the class, and write a new "
+        "docstring for {name} (and only for {name}).\n"
+        "The docstring must be using {style} style. Since this is a class, "
+        "only write a description for the purpose of the class, and list the "
+        "attributes. If the old docstring correctly reflects the purpose of "
+        "the code segment, return -1, else return only the docstring."
+    )
+    _FUNCTION_PROMPT: str = (
+        "You are a senior python engineer. Analyze the following code block "
+        "between <code.start> and <code.end>:"
+        "\n\n<code.start>\n{code}\n<code.end>\n\n"
+        "{docstring}"
+        "I want you to analyze the purpose of the code segment, and write a "
+        "new docstring for {name} (and only for {name}).\n"
+        "The docstring must be using {style} style. You must only write a "
+        "description of the function, list the attributes with a basic "
+        "description, explain any errors raised. Only explicitly show a "
+        "return if the function returns something not None. If the old "
+        "docstring correctly reflects the purpose of the code segment, "
+        "return -1, else return only the docstring."
+    )
+
     _model: str = None
     _client_api: AsyncOpenAIClient
+    _sem: asyncio.Semaphore
+    _bucket: AsyncLimiter
+    _cache: PromptCache | None = None
 
     def __init__(self, config: Config):
         self.config = config
         self.__init_client()
         self.parser = Parser(config=config)
+        # the style is the same for every prompt of the run
+        style = config.docstring_style
+        self._class_prompt = self._CLASS_PROMPT.replace("{style}", style)
+        self._function_prompt = self._FUNCTION_PROMPT.replace("{style}", style)
+        if config.use_cache:
+            self._cache = PromptCache(ttl_days=config.cache_ttl_days)
 
     def __init_client(self) -> None:
         self._model = self.config.use_model
         if self.config.use_llm_provider == "openai":  # todo other api?
-            if not OPENAI_API_KEY:
+            api_key = openai_api_key()
+            if not api_key:
                 raise EnvironmentError("No API key.")
-            self._client_api = AsyncOpenAIClient(api_key=OPENAI_API_KEY)
+            # a single pool shared by every request of the run
+            http_client = DefaultAsyncHttpxClient(
+                http2=True,
+                # no more connections than requests allowed in flight
+                limits=httpx.Limits(
+                    max_connections=self.config.max_concurrency,
+                    max_keepalive_connections=self.config.max_concurrency,
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+            # retries are handled by `openai_process`, with jitter
+            self._client_api = AsyncOpenAIClient(
+                api_key=api_key, max_retries=0, http_client=http_client
+            )
 
     def build_prompt(self, node: CovNode) -> str:
         if node.node_type == "ClassDef":
@@ -43,53 +269,129 @@ class Commenter:
             return self.build_function_prompt(node)
         return ""
 
-    def build_class_prompt(self, node: CovNode) -> str:
-        return (
-            f"You are a senior python engineer. Analyze the following class between <code.start> and <code.end>:\n\n<code.start>\n{node.code}\n<code.end>\n\n"
-            + (
-                f"This is the current docstring between <doc.start> and <doc.end>:\n\n<doc.start>\n{node.docstring}\n<doc.end>\n\n"
-                if node.docstring
-                else ""
-            )
-            + f"I want you to analyze the purpose of the class, and write a new docstring for {node.name} (and only for {node.name}).\n"
-            f"The docstring must be using {self.config.docstring_style} style. Since this is a class, only write a description for the purpose of the class, and list the attributes. "
-            "If the old docstring correctly reflects the purpose of the code segment, return -1, else return only the docstring."
+    def _build_prompt(self, template: str, node: CovNode) -> str:
+        docstring = (
+            self._DOCSTRING_PROMPT.format_map({"docstring": node.docstring})
+            if node.docstring
+            else ""
         )
+        return template.format_map(
+            {
+                "code": node.code,
+                "docstring": docstring,
+                "name": node.name,
+            }
+        )
+
+    def build_class_prompt(self, node: CovNode) -> str:
+        return self._build_prompt(self._class_prompt, node)
 
     def build_function_prompt(self, node: CovNode) -> str:
-        return (
-            f"You are a senior python engineer. Analyze the following code block between <code.start> and <code.end>:\n\n<code.start>\n{node.code}\n<code.end>\n\n"
-            + (
-                f"This is the current docstring between <doc.start> and <doc.end>:\n\n<doc.start>\n{node.docstring}\n<doc.end>\n\n"
-                if node.docstring
-                else ""
-            )
-            + f"I want you to analyze the purpose of the code segment, and write a new docstring for {node.name} (and only for {node.name}).\n"
-            f"The docstring must be using {self.config.docstring_style} style. You must only write a description of the function, "
-            f"list the attributes with a basic description, explain any errors raised. Only explicitly show a return if the function returns something not None. "
-            "If the old docstring correctly reflects the purpose of the code segment, return -1, else return only the docstring."
-        )
+        return self._build_prompt(self._function_prompt, node)
 
-    async def openai_process(
-        self, prompt: str, node_name: str, responses: dict[str, str]
-    ) -> None:
-        response = await self._client_api.responses.create(
+    async def openai_stream(self, prompt: str) -> str:
+        chunks = []
+        async with self._client_api.responses.stream(
             model=self._model, input=prompt
-        )
-        responses[node_name] = response.output_text
+        ) as stream:
+            async for event in stream:
+                if event.type != "response.output_text.delta":
+                    continue
+                chunks.append(event.delta)
+                if len(chunks) <= self.EARLY_EXIT_CHUNKS:
+                    head = "".join(chunks).lstrip()
+                    if head.startswith("-1") and head[2:3].isspace():
+                        # the current docstring is kept, whatever follows is
+                        # not needed; leaving the block closes the stream
+                        return "-1"
+        return "".join(chunks)
+
+    async def openai_process(
+        self, prompt: str, node_name: str
+    ) -> tuple[str, str]:
+        async with self._sem:
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception_type(RETRYABLE_ERRORS),
+                stop=stop_after_attempt(6),
+                wait=wait_random_exponential(min=1, max=60),
+                reraise=True,
+            ):
+                with attempt:
+                    async with self._bucket:
+                        text = await self.openai_stream(prompt)
+        return node_name, text
 
     async def process_prompt(
-        self, prompt: str, node_name: str, responses: dict[str, str]
-    ) -> None:
+        self, prompt: str, node_name: str
+    ) -> tuple[str, str] | None:
         if self.config.use_llm_provider == "openai":
-            await self.openai_process(prompt, node_name, responses)
+            return await self.openai_process(prompt, node_name)
+        return None
+
+    def _use_batch_api(self, prompts: dict[str, str]) -> bool:
+        return (
+            self.config.use_batch_api
+            and self.config.use_llm_provider == "openai"
+            and len(prompts) >= self.config.batch_threshold
+        )
+
+    def _cache_key(self, prompt: str) -> str:
+        return PromptCache.key(
+            self._model, self.config.docstring_style, prompt
+        )
+
+    def _get_cached(self, prompts: dict[str, str]) -> dict[str, str]:
+        if self._cache is None:
+            return {}
+        cached = {}
+        for key in prompts:
+            response = self._cache.get(key)
+            if response is not None:
+                cached[key] = response
+        return cached
+
+    def _set_cached(self, responses: dict[str, str]) -> None:
+        if self._cache is None:
+            return
+        self._cache.set_many(responses.items())
 
     async def process_prompts(self, prompts: dict[str, str]) -> dict[str, str]:
-        responses = {}
+        # identical prompts (i.e. boilerplate methods) are sent only once,
+        # keyed by the same hash as the on-disk cache
+        keys = {
+            name: self._cache_key(prompt) for name, prompt in prompts.items()
+        }
+        unique = {key: prompts[name] for name, key in keys.items()}
+        cached = self._get_cached(unique)
+        pending = {k: v for k, v in unique.items() if k not in cached}
+        responses = await self._process_pending(pending) if pending else {}
+        self._set_cached(responses)
+        responses |= cached
+        return {
+            name: responses[key]
+            for name, key in keys.items()
+            if key in responses
+        }
+
+    async def _process_pending(
+        self, prompts: dict[str, str]
+    ) -> dict[str, str]:
         start = timer()
+        if self._use_batch_api(prompts):
+            batch = BatchProcessor(client=self._client_api, model=self._model)
+            responses = await batch.process(prompts)
+            end = timer()
+            logger.info(
+                "Generated comments in batch in %.2f seconds.", end - start
+            )
+            return responses
 
+        # bound to the running event loop, hence created per run
+        self._sem = asyncio.Semaphore(self.config.max_concurrency)
+        self._bucket = AsyncLimiter(self.config.qpm, 60)
+        responses = {}
         tasks = [
-            asyncio.create_task(self.process_prompt(prompt, name, responses))
+            asyncio.create_task(self.process_prompt(prompt, name))
             for name, prompt in prompts.items()
         ]
 
@@ -98,31 +400,68 @@ class Commenter:
         ) as pbar:
             for fut in asyncio.as_completed(tasks):
                 try:
-                    await fut
+                    result = await fut
                 except Exception as e:
                     tqdm.write(f"[error]: a task failed: {e!r}")
+                else:
+                    if result is not None:
+                        name, text = result
+                        responses[name] = text
                 finally:
                     pbar.update(1)
 
         end = timer()
-        print(f"Generated comments concurrently in {end - start:.2f} seconds.")
+        logger.info(
+            "Generated comments concurrently in %.2f seconds.", end - start
+        )
         return responses
 
-    async def comment(self, nodes: list[CovNode]) -> dict[str, str]:
-        not_ignored = [
-            n
-            for n in nodes
-            if n.node_type in ["ClassDef", "FunctionDef", "AsyncFunctionDef"]
-        ]
-        prompts = {
-            node.name: self.build_prompt(node=node) for node in not_ignored
-        }
-        comments = await self.process_prompts(prompts=prompts)
+    def _likely_documented(self, node: CovNode) -> bool:
+        """Whether the docstring of a node already looks complete, i.e. it is
+        long enough and uses the sections of the configured style."""
+        docstring = node.docstring or ""
+        if len(docstring) < self.MIN_DOCUMENTED_LENGTH:
+            return False
+        markers = self.STYLE_MARKERS.get(self.config.docstring_style, ())
+        return any(marker in docstring for marker in markers)
+
+    async def comment(
+        self, nodes: dict[str, list[CovNode]]
+    ) -> dict[str, dict[str, str]]:
+        """Comment the nodes of every file within a single run, so that
+        requests for all files share the same connections and limits."""
+        prompts = {}
+        for file, file_nodes in nodes.items():
+            for node in file_nodes:
+                if node.node_type in [
+                    "ClassDef",
+                    "FunctionDef",
+                    "AsyncFunctionDef",
+                ]:
+                    if (
+                        self.config.skip_if_documented
+                        and self._likely_documented(node)
+                    ):
+                        continue
+                    key = f"{file}:{node.qualname}"
+                    prompts[key] = self.build_prompt(node=node)
+        responses = await self.process_prompts(prompts=prompts)
+        comments = {file: {} for file in nodes}
+        for key, response in responses.items():
+            # qualified names never contain a colon, file paths may
+            file, _, qualname = key.rpartition(":")
+            comments[file][qualname] = response
         return comments
 
     def document(self, nodes: dict[str, list[CovNode]]) -> None:
-        for file in nodes:
-            print(f"Checking file: {file}.", end="\t")
-            docs = asyncio.run(self.comment(nodes[file]))
-            docs = {k: v for k, v in docs.items() if v != "-1"}
-            self.parser.process(Path(file), docs)
+        comments = asyncio.run(self.comment(nodes))
+        jobs = [
+            (
+                Path(file),
+                {k: v for k, v in docs.items() if v.strip() != "-1"},
+            )
+            for file, docs in comments.items()
+        ]
+        modified = self.parser.process_all(jobs)
+        if self.config.post_processing.convert:
+            self.parser.convert_all(modified)
@@ -1,95 +1,320 @@
 import ast
+import functools
+import inspect
+import io
+import logging
+import re
 import subprocess
+import tokenize
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+
 from genpydoc.config.config import Config
 
+try:
+    import black
+except ImportError:  # black is only needed for the cleanup step
+    black = None
+
+logger = logging.getLogger(__name__)
+
 DocumentableFunc = ast.AsyncFunctionDef | ast.FunctionDef
 DocumentableFuncOrClass = DocumentableFunc | ast.ClassDef
 DocumentableNode = DocumentableFuncOrClass | ast.Module
+STATEMENT_TYPES = (ast.stmt, ast.excepthandler, ast.match_case)
+
+Edit = tuple[int, int, bytes]
+
+# surrounding whitespace and triple quotes of either kind
+_QUOTE_RE = re.compile(r"\s*(?:\"\"\"|''')?(.*?)(?:\"\"\"|''')?\s*", re.DOTALL)
 
 
-class Transformer(ast.NodeTransformer):
-    config: Config
+class Transformer(ast.NodeVisitor):
+    """Collect the source edits setting the new docstrings of a module.
+
+    The tree is left untouched: every docstring update is recorded as a
+    `(start, end, replacement)` byte range of the source, so that the rest of
+    the file can be kept as is.
+
+    Attributes:
+        comments (dict[str, str]): New docstrings, by qualified name.
+        source (bytes): The source of the module the tree was parsed from.
+        edits (list[Edit]): The edits collected while visiting the tree.
+    """
+
     comments: dict[str, str]
 
-    def __init__(self, config: Config, comments: dict[str, str]):
+    def __init__(self, comments: dict[str, str], source: bytes):
         super().__init__()
-        self.config = config
-        self.comments = comments
+        self.comments = {
+            name: _QUOTE_RE.fullmatch(comment).group(1)
+            for name, comment in comments.items()
+        }
+        self.source = source
+        self.edits: list[Edit] = []
+        self._lines = source.splitlines(keepends=True)
+        self._line_offsets = [0]
+        for line in self._lines:
+            self._line_offsets.append(self._line_offsets[-1] + len(line))
+        self._target_names: frozenset[str] = frozenset(self.comments)
+        # enclosing scopes of the targets, the only subtrees worth visiting
+        self._target_scopes: frozenset[str] = frozenset(
+            name.rsplit(".", i)[0]
+            for name in self._target_names
+            for i in range(1, name.count(".") + 1)
+        )
+        self._scope: list[str] = []
+
+    def generic_visit(self, node: ast.AST) -> None:
+        # definitions only ever appear in statements
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, STATEMENT_TYPES):
+                self.visit(child)
+
+    def _visit_helper(self, node: DocumentableNode) -> None:
+        self._scope.append(node.name)
+        qualname = ".".join(self._scope)
+        if qualname in self._target_names:
+            self._set_docstring(node, self.comments[qualname])
+        if qualname in self._target_scopes:
+            self.generic_visit(node)
+        self._scope.pop()
+
+    def _offset(self, lineno: int, col_offset: int) -> int:
+        """Byte offset in the source of an AST position."""
+        return self._line_offsets[lineno - 1] + col_offset
+
+    def _newline(self, lineno: int) -> bytes:
+        line = self._lines[lineno - 1]
+        return b"\r\n" if line.endswith(b"\r\n") else b"\n"
 
-    def _visit_helper(self, node: DocumentableNode) -> DocumentableNode:
-        if node.name not in self.comments:
-            return node
-        new_docstring = (
-            self.comments[node.name].removeprefix('"""').removesuffix('"""')
+    def _starts_line(self, lineno: int, col_offset: int) -> bool:
+        """Whether only indentation precedes a position on its line."""
+        return not self._lines[lineno - 1][:col_offset].strip()
+
+    def _anchor(self, stmt: ast.stmt) -> tuple[int, int]:
+        """Line and column where a statement starts, i.e. its first decorator
+        if any, as the `lineno` of a decorated definition is its `def` line."""
+        decorators = getattr(stmt, "decorator_list", None)
+        if not decorators:
+            return stmt.lineno, stmt.col_offset
+        first = min(decorators, key=lambda d: (d.lineno, d.col_offset))
+        # the decorator expression starts after the "@"
+        line = self._lines[first.lineno - 1]
+        return first.lineno, line.rfind(b"@", 0, first.col_offset)
+
+    @staticmethod
+    def _format_docstring(docstring: str, indent: str) -> str:
+        docstring = inspect.cleandoc(docstring)
+        docstring = docstring.replace("\\", "\\\\").replace('"""', '\\"""')
+        if docstring.endswith('"'):
+            docstring = docstring[:-1] + '\\"'
+        lines = docstring.splitlines()
+        if len(lines) <= 1:
+            return f'"""{docstring}"""'
+        body = "\n".join(
+            f"{indent}{line}" if line else "" for line in lines[1:]
         )
-        new_doc_code = ast.Expr(value=ast.Constant(value=new_docstring))
+        return f'"""{lines[0]}\n{body}\n{indent}"""'
+
+    def _set_docstring(self, node: DocumentableNode, docstring: str) -> None:
+        first = node.body[0]
+        lineno, col_offset = self._anchor(first)
+        starts_line = self._starts_line(lineno, col_offset)
+        newline = self._newline(lineno)
+        if starts_line:
+            line = self._lines[lineno - 1]
+            indent = line[:col_offset].decode()
+        else:
+            header = self._lines[node.lineno - 1]
+            indent = header[: len(header) - len(header.lstrip())].decode()
+            indent += " " * 4
+        literal = self._format_docstring(docstring, indent).encode()
+        literal = literal.replace(b"\n", newline)
         if (
-            node.body
-            and isinstance(node.body[0], ast.Expr)
-            and isinstance(getattr(node.body[0], "value", None), ast.Constant)
-            and isinstance(node.body[0].value.value, str)
+            isinstance(first, ast.Expr)
+            and isinstance(first.value, ast.Constant)
+            and isinstance(first.value.value, str)
         ):
-            node.body[0] = new_doc_code
+            start = self._offset(first.lineno, first.col_offset)
+            end = self._offset(first.end_lineno, first.end_col_offset)
+            self.edits.append((start, end, literal))
+        elif starts_line:
+            start = self._offset(lineno, 0)
+            indent = indent.encode()
+            self.edits.append((start, start, indent + literal + newline))
         else:
-            node.body.insert(0, new_doc_code)
-        return node
+            # single-line body: move it below the new docstring
+            end = self._offset(lineno, col_offset)
+            start = end
+            while self.source[start - 1 : start] in (b" ", b"\t"):
+                start -= 1
+            indent = indent.encode()
+            replacement = newline + indent + literal + newline + indent
+            self.edits.append((start, end, replacement))
 
-    def visit_ClassDef(
-        self, node: DocumentableFuncOrClass
-    ) -> DocumentableFuncOrClass:
-        return self._visit_helper(node=node)
+    def visit_ClassDef(self, node: DocumentableFuncOrClass) -> None:
+        self._visit_helper(node=node)
 
-    def visit_FunctionDef(
-        self, node: DocumentableFuncOrClass
-    ) -> DocumentableFuncOrClass:
-        return self._visit_helper(node=node)
+    def visit_FunctionDef(self, node: DocumentableFuncOrClass) -> None:
+        self._visit_helper(node=node)
 
-    def visit_AsyncFunctionDef(
-        self, node: DocumentableFuncOrClass
-    ) -> DocumentableFuncOrClass:
-        return self._visit_helper(node=node)
+    def visit_AsyncFunctionDef(self, node: DocumentableFuncOrClass) -> None:
+        self._visit_helper(node=node)
+
+
+def apply_edits(source: bytes, edits: list[Edit]) -> bytes:
+    """Apply non-overlapping edits to a source, last edit first so that the
+    offsets of the remaining ones stay valid."""
+    for start, end, replacement in sorted(edits, reverse=True):
+        source = source[:start] + replacement + source[end:]
+    return source
+
+
+def _process_file(
+    config: Config,
+    filepath: Path,
+    comments: dict[str, str],
+) -> Path | None:
+    """Entry point of the worker processes of `Parser.process_all`."""
+    return Parser(config=config).process(filepath, comments)
 
 
 class Parser:
+    PARALLEL_THRESHOLD: int = 8
+
     def __init__(self, config: Config):
         self.config = config
 
-    def process(self, filepath: Path, comments: dict[str, str]) -> None:
-        with open(filepath) as file:
-            source = file.read()
-        parsed_tree = ast.parse(source)
-        t = Transformer(config=self.config, comments=comments)
-        t.visit(parsed_tree)
-        filepath.write_text(ast.unparse(parsed_tree))
-        if (
-            self.config.post_processing.cleanup
-            or self.config.post_processing.convert
-        ):
-            self.post_process(
-                filepath,
-                cleanup=self.config.post_processing.cleanup,
-                convert=self.config.post_processing.convert,
+    def process(self, filepath: Path, comments: dict[str, str]) -> Path | None:
+        """Write the new docstrings of a file, returning its path if it was
+        rewritten. Docstring conversion is left to `convert_all`, so that it
+        runs once over every rewritten file."""
+        if not comments:
+            return None
+        source = filepath.read_bytes()
+        # parsed here rather than shipped from the extractor: only the files
+        # with new docstrings pay for it, and no tree crosses processes
+        tree = ast.parse(source)
+        encoding, _ = tokenize.detect_encoding(io.BytesIO(source).readline)
+        if encoding != "utf-8":
+            # the AST offsets count bytes of the lines encoded in UTF-8, and
+            # without the BOM
+            source = source.decode(encoding).encode("utf-8")
+        t = Transformer(comments=comments, source=source)
+        t.visit(tree)
+        if not t.edits:
+            # none of the comments matched a definition, leave the file as is
+            return None
+        source = apply_edits(source, t.edits)
+        if encoding != "utf-8":
+            # characters of the new docstrings the file encoding lacks are
+            # written as escapes, which the docstring literals decode back
+            source = source.decode("utf-8").encode(
+                encoding, errors="backslashreplace"
             )
+        try:
+            ast.parse(source, filename=str(filepath))
+        except SyntaxError as err:
+            # never overwrite a source file with something that does not parse
+            logger.error(
+                "skipping %s, its new docstrings break it: %s", filepath, err
+            )
+            return None
+        if self.config.post_processing.cleanup:
+            source = self.cleanup(filepath, source)
+        filepath.write_bytes(source)
+        return filepath
+
+    def process_all(
+        self, jobs: list[tuple[Path, dict[str, str]]]
+    ) -> list[Path]:
+        """Process several files, returning the paths of those rewritten.
 
-    def post_process(
-        self, filepath: str | Path, cleanup: bool = True, convert: bool = True
-    ) -> None:
-        if cleanup:
-            subprocess.run(f'black "{filepath}" -q', shell=True)
-        if convert:
-            if self.config.docstring_style not in [
-                "google",
-                "numpy",
-                "epytext",
-                "reST",
-            ]:
-                raise ValueError(
-                    "Style cannot be converted to with docconvert."
+        Files are independent from one another, so above
+        `PARALLEL_THRESHOLD` files they are processed in a pool of worker
+        processes; below it, starting the pool costs more than it saves.
+        """
+        if len(jobs) < self.PARALLEL_THRESHOLD:
+            paths = [self.process(*job) for job in jobs]
+        else:
+            filepaths, comments = zip(*jobs)
+            configs = [self.config] * len(jobs)
+            with ProcessPoolExecutor() as executor:
+                paths = list(
+                    executor.map(_process_file, configs, filepaths, comments)
                 )
-            subprocess.run(
-                f'docconvert "{filepath}" --output {self.config.docstring_style} --in-place',
-                shell=True,
-                input="y\n",
-                text=True,
+        return [path for path in paths if path is not None]
+
+    @staticmethod
+    @functools.cache
+    def _black_mode(pyproject: str | None) -> "black.Mode":
+        """Black mode honouring the `[tool.black]` table of the project."""
+        if pyproject is None:
+            return black.Mode()
+        options = black.parse_pyproject_toml(pyproject)
+        return black.Mode(
+            line_length=options.get("line_length", black.DEFAULT_LINE_LENGTH),
+            string_normalization=not options.get(
+                "skip_string_normalization", False
+            ),
+            magic_trailing_comma=not options.get(
+                "skip_magic_trailing_comma", False
+            ),
+            preview=options.get("preview", False),
+        )
+
+    def cleanup(self, filepath: str | Path, source: bytes) -> bytes:
+        """Format a source with black, in memory, using the configuration of
+        the project the file belongs to."""
+        if black is None:
+            logger.warning(
+                "black is not installed, skipping cleanup; install the "
+                "`cleanup` extra of genpydoc to enable it."
+            )
+            return source
+        pyproject = black.find_pyproject_toml((str(filepath),))
+        encoding, _ = tokenize.detect_encoding(io.BytesIO(source).readline)
+        try:
+            formatted = black.format_file_contents(
+                source.decode(encoding),
+                fast=False,
+                mode=self._black_mode(pyproject),
             )
+        except black.NothingChanged:
+            return source
+        return formatted.encode(encoding)
+
+    def _check_convertible(self) -> None:
+        if self.config.docstring_style not in [
+            "google",
+            "numpy",
+            "epytext",
+            "reST",
+        ]:
+            raise ValueError("Style cannot be converted to with docconvert.")
+
+    def convert(self, filepath: str | Path) -> None:
+        """Convert the docstrings of a file to the configured style with
+        docconvert, which only works on files."""
+        self._check_convertible()
+        subprocess.run(
+            [
+                "docconvert",
+                str(filepath),
+                "--output",
+                self.config.docstring_style,
+                "--in-place",
+            ],
+            input="y\n",
+            text=True,
+        )
+
+    def convert_all(self, filepaths: list[Path]) -> None:
+        """Convert the docstrings of several files at once; docconvert takes
+        a single file per invocation, so the invocations run in parallel."""
+        if not filepaths:
+            return
+        self._check_convertible()
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(self.convert, filepaths))
@@ -1,18 +1,18 @@
-import tomllib
-from typing import Any, Literal
+from typing import Literal
 
 import attr
 
 
+@attr.s(slots=True)
 class PostProcessingConfig:
-    cleanup: bool = attr.ib(default=True)
+    cleanup: bool = attr.ib(default=False)
     convert: bool = attr.ib(default=True)
 
 
-@attr.s
+@attr.s(slots=True, frozen=True)
 class Config:
-    VALID_STYLES = ("sphinx", "google")  # FIXME needed?
-    VALID_LLM_PROVIDERS = ("openai",)
+    VALID_STYLES = frozenset(("sphinx", "google", "numpy", "epytext", "reST"))
+    VALID_LLM_PROVIDERS = frozenset(("openai",))
 
     docstring_style: str = attr.ib(default="sphinx")
     ignore_magic: bool = attr.ib(default=False)
@@ -27,31 +27,31 @@ class Config:
     ignore_overloaded_functions: bool = attr.ib(default=False)
     include_only_covered: bool = attr.ib(default=True)
     run_on_diff: bool = attr.ib(default=True)
+    skip_if_documented: bool = attr.ib(default=False)
+    use_batch_api: bool = attr.ib(default=False)
+    batch_threshold: int = attr.ib(default=20)
+    max_concurrency: int = attr.ib(default=50)
+    qpm: int = attr.ib(default=500)
+    use_cache: bool = attr.ib(default=True)
+    cache_ttl_days: int = attr.ib(default=30)
     use_llm_provider: Literal["openai"] = attr.ib(
         default="openai"
     )  # TODO validate
     use_model: str = attr.ib(default="gpt-5-nano")  # TODO validate
     post_processing: PostProcessingConfig = attr.ib(
-        default=PostProcessingConfig()
+        default=attr.Factory(PostProcessingConfig)
     )
 
     @use_llm_provider.validator
     def _validate_llm_provider(self, _attribute, value) -> None:
         if value not in self.VALID_LLM_PROVIDERS:
             raise ValueError(
-                f"Invalid LLM provider '{value}'.\nSelect one of the following: {', '.join(self.VALID_LLM_PROVIDERS)}"
+                f"Invalid LLM provider '{value}'.\nSelect one of the following: {', '.join(sorted(self.VALID_LLM_PROVIDERS))}"
             )
 
     @docstring_style.validator
     def _validate_style(self, _attribute, value) -> None:
         if value not in self.VALID_STYLES:
             raise ValueError(
-                f"invalid docstring_style '{value}'.\nSelect one of the following: {', '.join(self.VALID_STYLES)}"
+                f"invalid docstring_style '{value}'.\nSelect one of the following: {', '.join(sorted(self.VALID_STYLES))}"
             )
-
-
-def parse_pyproject_toml(path_config: str) -> dict[str, Any] | None:
-    with open(path_config, "rb") as file:
-        toml = tomllib.load(file)
-    config = toml.get("tool", {}).get("genpydoc")
-    return {k.replace("-", "_"): v for k, v in config.items()}
@@ -1,10 +1,11 @@
+import logging
 import os
 
-from genpydoc.commenter import Commenter
 from genpydoc.config.config import Config
 from genpydoc.utils.utils import find_project_root
 from genpydoc.extractor.extract import Extract
-from genpydoc.git_retriever.git_retriever import GitRetriever
+
+logger = logging.getLogger(__name__)
 
 
 class Documenter:
@@ -23,13 +24,20 @@ class Documenter:
             nodes = all_nodes
 
         if self.config.run_on_diff:
-            print("Filtering on git changes...")
+            # GitPython is only loaded when the diff is actually needed
+            from genpydoc.git_retriever.git_retriever import GitRetriever
+
+            logger.info("Filtering on git changes...")
             root = find_project_root((os.path.dirname(__file__),))
             gitter = GitRetriever(root, covered_nodes, nodes)
             nodes = gitter.extract_diff()
 
         if nodes:
+            # the OpenAI client, httpx and black are only loaded when there
+            # is something to comment
+            from genpydoc.commenter.commenter import Commenter
+
             commenter = Commenter(config=self.config)
             commenter.document(nodes=nodes)
         else:
-            print("Nothing to comment.")
+            logger.info("Nothing to comment.")
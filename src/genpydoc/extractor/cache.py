@@ -0,0 +1,124 @@
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from genpydoc.config.config import Config
+
+
+@functools.cache
+def _extractor_stamp() -> str:
+    """Modification times of the modules shaping the extracted nodes."""
+    modules = sorted(Path(__file__).parent.glob("*.py"))
+    modules.append(Path(__file__).parent.parent / "config" / "config.py")
+    return ",".join(str(os.stat(module).st_mtime_ns) for module in modules)
+
+
+class NodeCache:
+    """Persistent cache of the nodes extracted from a file.
+
+    Each file has a single entry, overwritten whenever it is extracted
+    again, which stores its nodes along with a stamp of the modification
+    time and size of the file, the options they were extracted with and the
+    version of the extractor itself, so that an edited file, different
+    options or an upgrade never reuses stale nodes.
+
+    Attributes:
+        path (Path): Directory holding one pickle per cached file.
+        ttl_days (int | None): Age, in days, after which an entry is
+            discarded; never, if not set.
+    """
+
+    DEFAULT_PATH: Path = Path.home() / ".cache" / "genpydoc" / "ast"
+    MISSING: Any = object()
+    # the options of the configuration the extraction depends on; the others
+    # (LLM, network, caching, ...) leave the nodes unchanged
+    CONFIG_FIELDS: tuple[str, ...] = (
+        "docstring_style",
+        "ignore_magic",
+        "ignore_module",
+        "ignore_private",
+        "ignore_semiprivate",
+        "ignore_init_method",
+        "ignore_nested_classes",
+        "ignore_nested_functions",
+        "ignore_property_setters",
+        "ignore_property_decorators",
+        "ignore_overloaded_functions",
+        "include_only_covered",
+    )
+
+    def __init__(
+        self, path: str | Path | None = None, ttl_days: int | None = None
+    ):
+        self.path = Path(path) if path else self.DEFAULT_PATH
+        self.ttl_days = ttl_days
+        self.path.mkdir(parents=True, exist_ok=True)
+        if ttl_days:
+            self._purge(time.time() - ttl_days * 86400)
+
+    def _purge(self, before: float) -> None:
+        # entries of deleted or renamed files are never overwritten, and
+        # leftovers of interrupted writes never renamed
+        for entry in self.path.iterdir():
+            try:
+                if entry.stat().st_mtime < before:
+                    entry.unlink()
+            except OSError:
+                pass
+
+    def _entry(self, filename: str | Path) -> Path:
+        digest = hashlib.blake2b(
+            os.path.abspath(filename).encode(), digest_size=16
+        ).hexdigest()
+        return self.path / f"{digest}.pkl"
+
+    @classmethod
+    def stamp(cls, filename: str | Path, config: Config) -> str | None:
+        """Stamp the state of a file, or None if it cannot be stat'ed."""
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return "\x00".join(
+            (
+                str(stat.st_mtime_ns),
+                str(stat.st_size),
+                repr([getattr(config, name) for name in cls.CONFIG_FIELDS]),
+                _extractor_stamp(),
+            )
+        )
+
+    def get(self, filename: str | Path, stamp: str) -> Any:
+        """Cached nodes of a file, or `MISSING` if there are none for this
+        stamp."""
+        try:
+            with open(self._entry(filename), "rb") as file:
+                cached_stamp, nodes = pickle.load(file)
+        except (
+            OSError,
+            pickle.UnpicklingError,
+            EOFError,
+            AttributeError,
+            ValueError,
+            TypeError,
+        ):
+            return self.MISSING
+        return nodes if cached_stamp == stamp else self.MISSING
+
+    def set(self, filename: str | Path, stamp: str, nodes: Any) -> None:
+        # written aside then renamed, as workers may store entries at once
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(
+                    (stamp, nodes), file, protocol=pickle.HIGHEST_PROTOCOL
+                )
+            os.replace(tmp, self._entry(filename))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
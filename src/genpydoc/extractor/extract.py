@@ -1,55 +1,135 @@
 import ast
+import fnmatch
+import importlib.util
+import logging
 import os.path
 import pathlib
+import re
 import sys
-from fnmatch import fnmatch
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterator
+from typing import Iterable, Iterator
+
+import attr
 
 from genpydoc.config.config import Config
+from genpydoc.extractor.cache import NodeCache
 from genpydoc.extractor.visit import CovNode
 from genpydoc.utils.utils import get_common_base
 from genpydoc.extractor import visit
 
+logger = logging.getLogger(__name__)
+
+
+_worker_extract: "Extract | None" = None
+
+
+def _init_coverage_worker(config: Config) -> None:
+    """Initializer of the worker processes of `Extract._get_coverage`,
+    building the `Extract` every file of the process goes through."""
+    global _worker_extract
+    # the node cache was already purged by the parent process
+    _worker_extract = Extract([], attr.evolve(config, cache_ttl_days=0))
+
+
+def _file_coverage_worker(filename: str | Path) -> list[CovNode] | None:
+    """Entry point of the worker processes of `Extract._get_coverage`."""
+    return _worker_extract._get_file_coverage(filename)
+
 
 class Extract:
     COMMON_EXCLUDE = [".tox", ".venv", "venv", ".git", ".hg"]
     VALID_EXTENSIONS = [".py", ".pyi"]
+    PARALLEL_THRESHOLD = 8
 
     def __init__(self, paths, config: Config | None = None):
         self.paths = paths
-        self.extensions = set(".py")
+        self.extensions = (".py",)
         self.config = config if config else Config()
         self.excluded = ()
         self.common_base = pathlib.Path("/")
         self.output_formatter = None
         self._add_common_exclude()
+        # a single pattern matching every excluded path and what is below it
+        self._excluded_re = re.compile(
+            "|".join(fnmatch.translate(exc + "*") for exc in self.excluded)
+            or "(?!)"
+        )
         self.skipped_file_count = 0
+        self._cache = (
+            NodeCache(ttl_days=self.config.cache_ttl_days)
+            if self.config.use_cache
+            else None
+        )
 
     def _add_common_exclude(self) -> None:
-        for path in self.paths:
-            self.excluded = self.excluded + tuple(
-                os.path.join(path, i) for i in self.COMMON_EXCLUDE
-            )
+        self.excluded += tuple(
+            os.path.join(path, i)
+            for path in self.paths
+            for i in self.COMMON_EXCLUDE
+        )
 
-    def _filter_files(self, files: list[str]) -> Iterator[str]:
+    def _filter_files(self, files: Iterable[str]) -> Iterator[str]:
         for file in files:
-            has_valid_ext = any(
-                [file.endswith(ext) for ext in self.extensions]
-            )
-            if not has_valid_ext:
+            if not file.endswith(self.extensions):
                 continue
-            basename = os.path.basename(file)
-            if basename == "__init__":  # always ignore __init__ files
+            # paths come from os.scandir, which always joins with os.sep
+            basename = file.rpartition(os.sep)[2]
+            # always ignore __init__ files
+            if basename.startswith("__init__."):
                 continue
-            if any(fnmatch(file, exc + "*") for exc in self.excluded):
+            if self._excluded_re.match(file):
                 continue
             yield file
 
+    def _walk(self, path: str) -> Iterator[str]:
+        """Paths of the files below a directory, in the order of `os.walk`.
+
+        Directory entries come from `os.scandir`, which knows their type
+        without a `stat` call each, and the directories of `COMMON_EXCLUDE`
+        are never entered.
+        """
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            subdirs = []
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in self.COMMON_EXCLUDE:
+                                subdirs.append(entry.path)
+                        elif entry.is_file():
+                            yield entry.path
+            except OSError:
+                continue
+            stack.extend(reversed(subdirs))
+
     def _filter_nodes(self, nodes: list[CovNode]) -> list[CovNode]:
-        if self.config.ignore_module:
-            return [node for node in nodes if node.node_type != "Module"]
-        return nodes
+        """Nodes kept by the configuration, selected in a single pass.
+
+        The visitor lists parents before their children, so the nested
+        classes are known by the time their members are reached.
+        """
+        config = self.config
+        google_style = config.docstring_style == "google"
+        nested_cls: set[CovNode] = set()
+        filtered_nodes = []
+        for node in nodes:
+            if config.ignore_module and node.node_type == "Module":
+                continue
+            if config.ignore_nested_functions and node.is_nested_func:
+                continue
+            if config.ignore_nested_classes:
+                if node.is_nested_cls:
+                    nested_cls.add(node)
+                    continue
+                if node.parent in nested_cls:
+                    continue
+            if google_style:
+                self._set_google_style(node)
+            filtered_nodes.append(node)
+        return filtered_nodes
 
     @staticmethod
     def _filter_empty_nodes(
@@ -60,21 +140,12 @@ class Extract:
         return [node for node in nodes if node.covered]
 
     @staticmethod
-    def _filter_inner_nested(nodes: list[CovNode]) -> list[CovNode]:
-        nested_cls = [n for n in nodes if n.is_nested_cls]
-        inner_nested_nodes = [n for n in nodes if n.parent in nested_cls]
-        filtered_nodes = [n for n in nodes if n not in inner_nested_nodes]
-        filtered_nodes = [n for n in filtered_nodes if n not in nested_cls]
-        return filtered_nodes
-
-    @staticmethod
-    def _set_google_style(nodes: list[CovNode]) -> None:
-        for node in nodes:
-            if node.node_type == "FunctionDef" and node.name == "__init__":
-                if not node.covered and node.parent.covered:
-                    setattr(node, "covered", True)
-                elif node.covered and not node.parent.covered:
-                    setattr(node.parent, "covered", True)
+    def _set_google_style(node: CovNode) -> None:
+        if node.node_type == "FunctionDef" and node.name == "__init__":
+            if not node.covered and node.parent.covered:
+                setattr(node, "covered", True)
+            elif node.covered and not node.parent.covered:
+                setattr(node.parent, "covered", True)
 
     def get_filenames_from_path(self) -> list[str]:
         filenames = []
@@ -84,18 +155,16 @@ class Extract:
                     path.endswith(ext) for ext in self.VALID_EXTENSIONS
                 )
                 if not has_valid_extension:
-                    print(f"invalid file {path}")
+                    logger.error("invalid file %s", path)
                     return sys.exit(1)
                 filenames.append(path)
                 continue
 
-            for root, _, fs in os.walk(path):
-                full_paths = [os.path.join(root, f) for f in fs]
-                filenames.extend(self._filter_files(full_paths))
+            filenames.extend(self._filter_files(self._walk(path)))
 
         if not filenames:
             p = ", ".join(self.paths)
-            print(f"no python files found in {p}")
+            logger.error("no python files found in %s", p)
             return sys.exit(1)
 
         self.common_base = get_common_base(filenames)
@@ -106,8 +175,9 @@ class Extract:
     ) -> tuple[dict[str, list[CovNode]], dict[str, list[CovNode]]]:
         results: dict[str, list[CovNode]] = {}
         covered_results: dict[str, list[CovNode]] = {}
-        for filename in filenames:
-            result = self._get_file_coverage(filename)
+        for filename, result in zip(
+            filenames, self._iter_file_coverage(filenames)
+        ):
             covered_result = self._filter_empty_nodes(result)
             if result:
                 results[filename] = result
@@ -115,11 +185,49 @@ class Extract:
                 covered_results[filename] = covered_result
         return results, covered_results
 
+    def _iter_file_coverage(
+        self, filenames: list[str | Path]
+    ) -> Iterator[list[CovNode] | None]:
+        """Coverage of every file, in order. Parsing and visiting is pure
+        Python CPU work, so above `PARALLEL_THRESHOLD` files it is spread
+        over a pool of worker processes; below it, starting the pool costs
+        more than it saves."""
+        if len(filenames) < self.PARALLEL_THRESHOLD:
+            yield from map(self._get_file_coverage, filenames)
+            return
+        workers = os.cpu_count() or 1
+        chunksize = max(1, len(filenames) // (4 * workers))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_coverage_worker,
+            initargs=(self.config,),
+        ) as executor:
+            yield from executor.map(
+                _file_coverage_worker, filenames, chunksize=chunksize
+            )
+
     def _get_file_coverage(self, filename: str | Path) -> list[CovNode] | None:
-        with open(filename) as f:
-            source = f.read()
+        """Coverage of a file, served from the node cache when the file did
+        not change since it was last extracted."""
+        if self._cache is None:
+            return self._extract_file_coverage(filename)
+        stamp = NodeCache.stamp(filename, self.config)
+        if stamp is None:
+            return self._extract_file_coverage(filename)
+        nodes = self._cache.get(filename, stamp)
+        if nodes is NodeCache.MISSING:
+            nodes = self._extract_file_coverage(filename)
+            self._cache.set(filename, stamp, nodes)
+        return nodes
 
-        parsed_tree = ast.parse(source)
+    def _extract_file_coverage(
+        self, filename: str | Path
+    ) -> list[CovNode] | None:
+        # parsed from the bytes, so that ast honours any coding declaration,
+        # and decoded the same way for the source segments of the visitor
+        data = Path(filename).read_bytes()
+        parsed_tree = ast.parse(data, filename=str(filename))
+        source = importlib.util.decode_source(data)
         visitor = visit.Visitor(filename, self.config, source)
         visitor.visit(parsed_tree)
 
@@ -127,17 +235,13 @@ class Extract:
         if len(filtered_nodes) == 0:
             return None
 
-        if self.config.ignore_nested_functions:
-            filtered_nodes = [
-                node for node in filtered_nodes if node.is_nested_func
-            ]
-
-        if self.config.ignore_nested_classes:
-            filtered_nodes = self._filter_inner_nested(filtered_nodes)
-
-        if self.config.docstring_style == "google":
-            self._set_google_style(filtered_nodes)
-
+        # slicing and sanitizing the code is only worth it for the nodes that
+        # may be sent to the LLM
+        visitor.set_code(
+            node
+            for node in filtered_nodes
+            if node.covered or not self.config.include_only_covered
+        )
         return filtered_nodes
 
     def get_coverage(
@@ -1,15 +1,30 @@
 import ast
 import os.path
-from typing import Self
+import re
+from typing import Iterable, Literal, Self
 import attr
 from genpydoc.config.config import Config
 
 DocumentableFunc = ast.AsyncFunctionDef | ast.FunctionDef
 DocumentableFuncOrClass = DocumentableFunc | ast.ClassDef
 DocumentableNode = DocumentableFuncOrClass | ast.Module
-
-
-@attr.s(eq=False)
+DOCUMENTABLE_TYPES = (
+    ast.Module,
+    ast.ClassDef,
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+)
+# documentable nodes only ever appear in statements
+STATEMENT_TYPES = (ast.stmt, ast.excepthandler, ast.match_case)
+_FUNCTION_TYPES = frozenset(("FunctionDef", "AsyncFunctionDef"))
+# names ending with "__" take precedence, as they are neither private nor
+# semiprivate
+_NAME_CLASSIFIER = re.compile(
+    r"(?P<dunder>.*__)|(?P<private>__.*)|(?P<semiprivate>_.*)", re.DOTALL
+)
+
+
+@attr.s(eq=False, slots=True)
 class CovNode:
     """Coverage of an AST Node.
 
@@ -29,6 +44,7 @@ class CovNode:
         str docstring: The docstring of the node.
         str code: The source code of the node.
         CovNode parent: Parent node of current CovNode, if any.
+        int nlines: Number of source lines spanned by the node.
     """
 
     name: str = attr.field()
@@ -43,6 +59,18 @@ class CovNode:
     file: str = attr.field()
     docstring: str | None = attr.field(default=None)
     code: str | None = attr.field(default=None)
+    nlines: int | None = attr.field(default=None)
+
+    @property
+    def qualname(self) -> str:
+        """Dotted name of the node within its module (i.e. ``MyClass.
+        my_method``)."""
+        names = []
+        node = self
+        while node is not None and node.node_type != "Module":
+            names.append(node.name)
+            node = node.parent
+        return ".".join(reversed(names))
 
 
 class Visitor(ast.NodeVisitor):
@@ -52,149 +80,238 @@ class Visitor(ast.NodeVisitor):
     name, path, type, location, and associated docstring (when present). It also
     provides sanitized code with any docstrings removed and applies configuration
     driven ignore rules (e.g., private/semiprivate, __init__, magic methods,
-    property decorators, overloads).
+    property decorators, overloads). The code is only filled in, with
+    `set_code`, for the nodes that need it.
 
     Attributes:
         filename (str): The name of the file being analyzed.
         config (Config): Configuration controlling ignore rules and options.
         source (str): The full source code corresponding to the AST being visited.
-        stack (list[CovNode]): Stack of CovNodes representing the current nesting context.
         nodes (list[CovNode]): All CovNodes discovered during traversal.
     """
 
     def __init__(self, filename: str, config: Config, source: str):
         self.filename = filename
         self.config = config
+        self._basename = os.path.basename(filename)
+        # every definition within a function is either a nested function or
+        # a nested class, or belongs to one, so with both ignored there is no
+        # need to descend into function bodies
+        self._prune_functions = (
+            config.ignore_nested_functions and config.ignore_nested_classes
+        )
+        self._check_decorators = (
+            config.ignore_property_decorators
+            or config.ignore_property_setters
+            or config.ignore_overloaded_functions
+        )
         self.source: str = source
-        self.stack: list[CovNode] = []
         self.nodes: list[CovNode] = []
+        # split once, rather than by `ast.get_source_segment` for every node
+        self._lines: list[str] = source.split("\n")
+        self._ast_nodes: dict[CovNode, DocumentableNode] = {}
 
-    @staticmethod
-    def _has_doc(node: DocumentableNode) -> bool:
-        """Return whether the node has docstrings."""
-        return (
-            ast.get_docstring(node) is not None
-            and ast.get_docstring(node).strip() != ""
-        )
+    def set_code(self, nodes: Iterable[CovNode]) -> None:
+        """Fill in the sanitized code of some of the visited nodes."""
+        for node in nodes:
+            node.code = self._get_sanitized_code(self._ast_nodes[node])
 
     @staticmethod
-    def _get_sanitized_docstring(node: DocumentableNode) -> str:
-        """Returns a sanitized (stripped of whitespace) version of the docstring."""
-        return ast.get_docstring(node).strip()
+    def _extract_docstring(node: DocumentableNode) -> str | None:
+        """The stripped docstring of a node, or None if it has no docstring
+        or only a blank one."""
+        docstring = ast.get_docstring(node)
+        if docstring:
+            docstring = docstring.strip()
+        return docstring or None
 
     @staticmethod
-    def _remove_docstring_from_source(code: str, docstring: str) -> str:
-        """Removes docstrings from the source code."""
-        docstring = ['"""', *docstring.splitlines()]
-        return "\n".join(
-            (
-                line
-                for line in code.splitlines()
-                if line.strip() not in docstring
+    def _docstring_node(node: DocumentableNode) -> ast.Expr | None:
+        """The statement holding the docstring of a node, if any."""
+        if not node.body:
+            return None
+        first = node.body[0]
+        if (
+            isinstance(first, ast.Expr)
+            and isinstance(first.value, ast.Constant)
+            and isinstance(first.value.value, str)
+        ):
+            return first
+        return None
+
+    def _slice(
+        self,
+        lineno: int,
+        col_offset: int,
+        end_lineno: int,
+        end_col_offset: int,
+    ) -> str:
+        """Source between two AST positions; the column offsets are in bytes
+        of the UTF-8 encoded lines."""
+        lineno -= 1
+        end_lineno -= 1
+        if lineno == end_lineno:
+            line = self._lines[lineno].encode()
+            return line[col_offset:end_col_offset].decode()
+        first = self._lines[lineno].encode()[col_offset:].decode()
+        last = self._lines[end_lineno].encode()[:end_col_offset].decode()
+        return "\n".join([first, *self._lines[lineno + 1 : end_lineno], last])
+
+    def _source_segment(self, node: DocumentableNode) -> str | None:
+        """Same as `ast.get_source_segment` for a source with `\n` line
+        endings, as decoded by the extractor."""
+        try:
+            if node.end_lineno is None or node.end_col_offset is None:
+                return None
+            return self._slice(
+                node.lineno,
+                node.col_offset,
+                node.end_lineno,
+                node.end_col_offset,
             )
-        )
+        except AttributeError:
+            return None
 
     def _get_sanitized_code(self, node: DocumentableNode) -> str | None:
-        """Returns a code segment for a node, sanitized of any docstrings."""
-        code = ast.get_source_segment(self.source, node)
-        if self._has_doc(node) and code:
-            code = self._remove_docstring_from_source(
-                code=code, docstring=self._get_sanitized_docstring(node)
-            )
-        return code
+        """Returns a code segment for a node, sanitized of its docstring.
+
+        The docstring statement is cut out by its position in the tree, and
+        the lines it leaves blank are dropped along with it.
+        """
+        code = self._source_segment(node)
+        expr = self._docstring_node(node) if code else None
+        if expr is None:
+            return code
+        before = self._slice(
+            node.lineno, node.col_offset, expr.lineno, expr.col_offset
+        )
+        after = self._slice(
+            expr.end_lineno,
+            expr.end_col_offset,
+            node.end_lineno,
+            node.end_col_offset,
+        )
+        head, newline, indent = before.rpartition("\n")
+        if (
+            newline
+            and not indent.strip()
+            and not after.split("\n", 1)[0].strip()
+        ):
+            # the docstring had lines of its own
+            return head + after.lstrip(" \t")
+        return before + after
+
+    def _is_ignored(self, node: DocumentableNode) -> bool:
+        """Should the AST visitor ignore this node and its children."""
+        if isinstance(node, ast.ClassDef):
+            return self._is_class_ignored(node)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return self._is_func_ignored(node)
+        return False
 
     def _visit_helper(self, node: DocumentableNode) -> None:
-        """Recursively visit AST node for docstrings."""
-        file = os.path.basename(self.filename)
-        if not hasattr(node, "name"):
-            node_name = os.path.basename(self.filename)
+        """Visit AST node and its children for docstrings.
+
+        The tree is walked depth-first with an explicit stack of
+        `(ast node, enclosing CovNode)` pairs, only descending into
+        statements, so that the nodes are recorded in the same pre-order as
+        a recursive traversal.
+        """
+        todo: list[tuple[ast.AST, CovNode | None]] = [(node, None)]
+        while todo:
+            current, parent = todo.pop()
+            if isinstance(current, DOCUMENTABLE_TYPES):
+                if self._is_ignored(current):
+                    continue
+                parent = self._make_cov_node(current, parent)
+                self.nodes.append(parent)
+                if self._prune_functions and parent.node_type in (
+                    _FUNCTION_TYPES
+                ):
+                    continue
+            children = [
+                (child, parent)
+                for child in ast.iter_child_nodes(current)
+                if isinstance(child, STATEMENT_TYPES)
+            ]
+            todo.extend(reversed(children))
+
+    def _make_cov_node(
+        self, node: DocumentableNode, parent: CovNode | None
+    ) -> CovNode:
+        """Build the coverage record of a node."""
+        file = self._basename
+        if isinstance(node, ast.Module):
+            node_name = file
         else:
             node_name = node.name
-        parent = None
         path = node_name
-        if self.stack:
-            parent = self.stack[-1]
+        if parent is not None:
             parent_path: str = parent.path
             path = (":" if parent_path.endswith(".py") else ".").join(
                 [parent_path, node_name]
             )
         lineno = None
-        if hasattr(node, "lineno"):
+        nlines = None
+        if not isinstance(node, ast.Module):
             lineno = node.lineno
+            nlines = node.end_lineno - node.lineno + 1
         node_type = type(node).__name__
+        docstring = self._extract_docstring(node)
+        covered = docstring is not None
         cov_node = CovNode(
             name=node_name,
             path=path,
-            covered=self._has_doc(node),
-            level=len(self.stack),
+            covered=covered,
+            level=0 if parent is None else parent.level + 1,
             node_type=node_type,
             lineno=lineno,
             is_nested_func=self._is_nested_func(parent, node_type),
             is_nested_cls=self._is_nested_cls(parent, node_type),
             parent=parent,
             file=file,
-            docstring=(
-                self._get_sanitized_docstring(node)
-                if self._has_doc(node)
-                else None
-            ),
-            code=self._get_sanitized_code(node),
+            docstring=docstring,
+            nlines=nlines,
         )
-        self.stack.append(cov_node)
-        self.nodes.append(cov_node)
-        self.generic_visit(node)
-        self.stack.pop()
+        self._ast_nodes[cov_node] = node
+        return cov_node
 
     @staticmethod
     def _is_nested_func(parent: CovNode | None, node_type: str) -> bool:
         """Is node a nested func/method of another func/method."""
         if parent is None:
             return False
-        if parent.node_type == "FunctionDef" and node_type == "FunctionDef":
-            return True
-        return False
+        return (
+            parent.node_type in _FUNCTION_TYPES
+            and node_type in _FUNCTION_TYPES
+        )
 
     @staticmethod
     def _is_nested_cls(parent: CovNode | None, node_type: str) -> bool:
         """Is node a nested func/method of another func/method."""
         if parent is None:
             return False
-        if (
-            parent.node_type in ["ClassDef", "FunctionDef"]
-            and node_type == "ClassDef"
-        ):
-            return True
-        return False
-
-    @staticmethod
-    def _is_private(node: DocumentableFuncOrClass) -> bool:
-        """Is node private (i.e. __MyClass, __my_func)."""
-        if node.name.endswith("__"):
-            return False
-        if not node.name.startswith("__"):
-            return False
-        return True
+        return node_type == "ClassDef" and (
+            parent.node_type == "ClassDef"
+            or parent.node_type in _FUNCTION_TYPES
+        )
 
     @staticmethod
-    def _is_semiprivate(node: DocumentableFuncOrClass) -> bool:
-        """Is node semiprivate (i.e. _MyClass, _my_func)."""
-        if node.name.endswith("__"):
-            return False
-        if node.name.startswith("__"):
-            return False
-        if not node.name.startswith("_"):
-            return False
-        return True
+    def _classify_name(
+        name: str,
+    ) -> Literal["dunder", "private", "semiprivate", "public"]:
+        """Visibility of a node name: dunder (i.e. __init__, _MyClass__),
+        private (i.e. __MyClass, __my_func), semiprivate (i.e. _MyClass,
+        _my_func) or public."""
+        match = _NAME_CLASSIFIER.fullmatch(name)
+        return match.lastgroup if match else "public"
 
     def _is_ignored_common(self, node: DocumentableFuncOrClass) -> bool:
         """Commonly-shared ignore checkers."""
-        is_private = self._is_private(node)
-        is_semiprivate = self._is_semiprivate(node)
-        if self.config.ignore_private and is_private:
-            return True
-        if self.config.ignore_semiprivate and is_semiprivate:
-            return True
-        return False
+        category = self._classify_name(node.name)
+        return (self.config.ignore_private and category == "private") or (
+            self.config.ignore_semiprivate and category == "semiprivate"
+        )
 
     def _is_class_ignored(self, node: DocumentableFuncOrClass) -> bool:
         """Should the AST visitor ignore this class node."""
@@ -202,76 +319,54 @@ class Visitor(ast.NodeVisitor):
 
     def _is_func_ignored(self, node: DocumentableFuncOrClass) -> bool:
         """Should the AST visitor ignore this func/method node."""
-        is_init = node.name == "__init__"
-        is_magic = all(
-            [
-                node.name != "__init__",
-                node.name.startswith("__"),
-                node.name.endswith("__"),
-            ]
-        )
-        has_property_decorators = self._has_property_decorators(node)
-        has_setters = self._has_setters(node)
-        has_overload = self._has_overload(node)
-        if self.config.ignore_init_method and is_init:
-            return True
-        if self.config.ignore_magic and is_magic:
-            return True
-        if self.config.ignore_property_decorators and has_property_decorators:
-            return True
-        if self.config.ignore_property_setters and has_setters:
-            return True
-        if self.config.ignore_overloaded_functions and has_overload:
+        config = self.config
+        if node.name == "__init__":
+            if config.ignore_init_method:
+                return True
+        elif (
+            config.ignore_magic
+            and node.name.startswith("__")
+            and node.name.endswith("__")
+        ):
             return True
+        # the decorators are only scanned when an option depends on them
+        if self._check_decorators:
+            (
+                has_property_decorators,
+                has_setters,
+                has_overload,
+            ) = self._decorator_flags(node)
+            if config.ignore_property_decorators and has_property_decorators:
+                return True
+            if config.ignore_property_setters and has_setters:
+                return True
+            if config.ignore_overloaded_functions and has_overload:
+                return True
         return self._is_ignored_common(node)
 
     @staticmethod
-    def _has_property_decorators(node: DocumentableFuncOrClass) -> bool:
-        """Detect if node has property get/setter/deleter decorators."""
-        if not hasattr(node, "decorator_list"):
-            return False
-        else:
-            for dec in node.decorator_list:
-                if hasattr(dec, "id"):
-                    if dec.id == "property":
-                        return True
-                if hasattr(dec, "attr"):
-                    if dec.attr == "setter":
-                        return True
-                    if dec.attr == "deleter":
-                        return True
-            return False
-
-    @staticmethod
-    def _has_setters(node: DocumentableFuncOrClass) -> bool:
-        """Detect if node has property get/setter decorators."""
-        if not hasattr(node, "decorator_list"):
-            return False
-        else:
-            for dec in node.decorator_list:
-                if hasattr(dec, "attr"):
-                    if dec.attr == "setter":
-                        return True
-            return False
-
-    @staticmethod
-    def _has_overload(node: DocumentableFuncOrClass) -> bool:
-        """Detect if node has a typing.overload decorator."""
-        if not hasattr(node, "decorator_list"):
-            return False
-        else:
-            for dec in node.decorator_list:
-                if (
-                    hasattr(dec, "attr")
-                    and hasattr(dec, "value")
-                    and hasattr(dec.value, "id")
-                    and dec.value.id
-                    and (dec.attr == "overload")
+    def _decorator_flags(
+        node: DocumentableFuncOrClass,
+    ) -> tuple[bool, bool, bool]:
+        """Detect, in a single pass over the decorators of a node, if it has
+        property get/setter/deleter decorators, a property setter decorator
+        and a typing.overload decorator."""
+        has_property_decorators = has_setters = has_overload = False
+        for dec in node.decorator_list:
+            if isinstance(dec, ast.Name):
+                if dec.id == "property":
+                    has_property_decorators = True
+                elif dec.id == "overload":
+                    has_overload = True
+            elif isinstance(dec, ast.Attribute):
+                if dec.attr in ("setter", "deleter"):
+                    has_property_decorators = True
+                    has_setters = has_setters or dec.attr == "setter"
+                elif dec.attr == "overload" and isinstance(
+                    dec.value, ast.Name
                 ):
-                    return True
-                if hasattr(dec, "id") and dec.id == "overload":
-                    return True
-            return False
+                    has_overload = True
+        return has_property_decorators, has_setters, has_overload
 
     def visit_Module(self, node: DocumentableNode) -> None:
         """Visit module for docstrings.
@@ -287,8 +382,6 @@ class Visitor(ast.NodeVisitor):
         Args:
             node (ast.ClassDef): a class AST node.
         """
-        if self._is_class_ignored(node):
-            return
         self._visit_helper(node=node)
 
     def visit_FunctionDef(self, node: DocumentableFuncOrClass) -> None:
@@ -297,8 +390,6 @@ class Visitor(ast.NodeVisitor):
         Args:
             node (ast.FunctionDef): a function/method AST node.
         """
-        if self._is_func_ignored(node):
-            return
         self._visit_helper(node=node)
 
     def visit_AsyncFunctionDef(self, node: DocumentableFuncOrClass) -> None:
@@ -308,6 +399,4 @@ class Visitor(ast.NodeVisitor):
             node (ast.AsyncFunctionDef): an async function/method AST
                 node.
         """
-        if self._is_func_ignored(node):
-            return
         self._visit_helper(node=node)
@@ -1,5 +1,6 @@
 import os.path
 import sys
+from bisect import bisect_left
 from pathlib import Path
 
 from git import Diff, Repo
@@ -19,31 +20,40 @@ class GitRetriever:
         self.covered_nodes = covered_nodes
         self.nodes = nodes
         self.lines = {}
-        self.__add_all()
+        # git reports paths relative to the root of the repository
+        self._prefix = os.path.join(root, "")
         self._diffed_map = self.__build_diffed_map()
-        if not self._diffed_map or all(
-            (
-                k not in self.covered_nodes.keys()
-                for k in self._diffed_map.keys()
-            )
-        ):
+        self._intervals = {
+            k: self._build_intervals(v)
+            for k, v in nodes.items()
+            if k in self._diffed_map
+        }
+        if self.covered_nodes.keys().isdisjoint(self._diffed_map):
             self.__stop_early()
-
-    def __add_all(self) -> None:
-        self.repo.git.add(all=True)
+        self._patch_by_path = self.__build_patch_map()
 
     def __build_diffed_map(self) -> dict[str, str]:
-        def _reverse_mapping(ct: str | None) -> str:
-            mapping = {"D": "A", "A": "D"}
-            if ct not in mapping:
-                return ct
-            return mapping[ct]
+        """Change type of every file differing from HEAD, staged or not.
 
-        d = self.repo.index.diff("HEAD")
-        return {
-            os.path.join(self.root, c.a_path): _reverse_mapping(c.change_type)
-            for c in d
+        The working tree is compared to HEAD directly, so the user's index is
+        left untouched; untracked files are reported as additions.
+        """
+        # names and change types only, patches are left to __build_patch_map
+        d = self.repo.head.commit.diff(None, create_patch=False)
+        diffed = {
+            self._prefix + (c.b_path or c.a_path): c.change_type for c in d
         }
+        for path in self.repo.untracked_files:
+            diffed[self._prefix + path] = "A"
+        return diffed
+
+    def __build_patch_map(self) -> dict[str, Diff]:
+        """Patches of every diffed file, computed with a single git call."""
+        paths = [k for k, v in self._diffed_map.items() if v != "A"]
+        if not paths:
+            return {}
+        d = self.repo.head.commit.diff(None, paths=paths, create_patch=True)
+        return {self._prefix + (c.b_path or c.a_path): c for c in d}
 
     @staticmethod
     def __stop_early() -> None:
@@ -54,55 +64,51 @@ class GitRetriever:
     def _process_diff(diff: Diff) -> set[int]:
         return process_git_diff(diff)
 
-    def _extract_lines(self) -> dict[str, set[CovNode]]:
-        lines_for_evaluation: dict[str, set[CovNode]] = {}
+    def _extract_lines(self) -> dict[str, list[CovNode]]:
+        lines_for_evaluation: dict[str, list[CovNode]] = {}
         for k in self._diffed_map.keys():
-            diff = self.repo.index.diff("HEAD", paths=k, create_patch=True)
-            if len(diff) > 1:
-                raise ValueError
-            if len(diff):
-                diff = diff[0]
             if self._diffed_map.get(k, "A") == "A" and k in self.nodes:
                 lines_for_evaluation[k] = self.nodes[k]
-            else:
+            elif k in self._patch_by_path:
+                diff = self._patch_by_path[k]
                 lines = self._match_lines_to_ast(k, self._process_diff(diff))
                 lines_for_evaluation[k] = lines
+            else:
+                lines_for_evaluation[k] = []
         return lines_for_evaluation
 
-    def _match_lines_to_ast(self, k: str, lines: set[int]) -> set[CovNode]:
-        definitions = set()
-        for line in lines:
-            traversed_nodes: list[CovNode] = []
-            if k in self.nodes:
-                for node in self.nodes[k]:
-                    if node.level == 0:
-                        continue
-                    if (
-                        node.lineno
-                        <= line
-                        < node.lineno + len(node.code.splitlines())
-                    ):
-                        traversed_nodes.append(node)
-            if len(traversed_nodes) > 0:
-                for n in traversed_nodes:
-                    definitions.add(n)
-            else:
-                continue
+    @staticmethod
+    def _build_intervals(
+        nodes: list[CovNode],
+    ) -> list[tuple[int, int, CovNode]]:
+        """Line span `[start, end)` of every non-module node of a file."""
+        return [
+            (node.lineno, node.lineno + node.nlines, node)
+            for node in nodes
+            if node.level != 0
+        ]
+
+    def _match_lines_to_ast(self, k: str, lines: set[int]) -> list[CovNode]:
+        # every node has a single interval, a list needs no deduplication
+        definitions = []
+        sorted_lines = sorted(lines)
+        for start, end, node in self._intervals.get(k, []):
+            # first changed line at or after the node start
+            i = bisect_left(sorted_lines, start)
+            if i < len(sorted_lines) and sorted_lines[i] < end:
+                definitions.append(node)
         return definitions
 
     @staticmethod
     def _analyze_covered_nodes(
-        diffed_nodes: dict[str, set[CovNode]],
-    ) -> dict[str, set[CovNode]]:
-        keys = list(diffed_nodes.keys())
-        for k in keys:
-            nodes = {node for node in diffed_nodes[k] if node.covered}
-            if not nodes:
-                del diffed_nodes[k]
-                continue
-            diffed_nodes[k] = nodes
-        return diffed_nodes
+        diffed_nodes: dict[str, list[CovNode]],
+    ) -> dict[str, list[CovNode]]:
+        return {
+            k: covered
+            for k, nodes in diffed_nodes.items()
+            if (covered := [node for node in nodes if node.covered])
+        }
 
-    def extract_diff(self) -> dict[str, set[CovNode]]:
+    def extract_diff(self) -> dict[str, list[CovNode]]:
         nodes_diffed = self._extract_lines()
         return self._analyze_covered_nodes(nodes_diffed)
@@ -1,11 +1,17 @@
 import re
 from dataclasses import dataclass
 from enum import StrEnum
-from typing import Optional
+from typing import Iterator, Optional
 
 from git import Diff
 
 HUNK_REGEX = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+# a hunk header, or a context, added or removed line; anything else (e.g.
+# "\ No newline at end of file") is left out
+DIFF_LINE_REGEX = re.compile(
+    rb"^(?:@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@.*|([-+ ])(.*?))\r?$",
+    re.MULTILINE,
+)
 
 
 class DiffChangeType(StrEnum):
@@ -15,7 +21,7 @@ class DiffChangeType(StrEnum):
     BLANK = " "
 
 
-@dataclass
+@dataclass(slots=True)
 class DiffChange:
     old_lineno: Optional[int]
     new_lineno: Optional[int]
@@ -33,52 +39,59 @@ class ChangeType(StrEnum):
     # U = "U"
 
 
-def parse_diff(diff_text: str | bytes | None) -> list[DiffChange]:
-    changes = []
+def _iter_diff_lines(
+    diff_text: str | bytes | None,
+) -> Iterator[tuple[bytes, int, int, bytes]]:
+    """`(kind, old_lineno, new_lineno, text)` of every line of the hunks of a
+    patch, numbered before the line itself.
+
+    The whole patch is scanned by a single regex, so that the lines are split
+    and classified by the regex engine rather than one by one in Python.
+    """
+    if not diff_text:
+        return
+    if isinstance(diff_text, str):
+        diff_text = diff_text.encode("utf-8")
 
     old_lineno = None
     new_lineno = None
-
-    if isinstance(diff_text, bytes):
-        diff_text = diff_text.decode("utf-8")
-
-    for line in diff_text.splitlines():
-        m = HUNK_REGEX.match(line)
-        if m:
-            old_lineno = int(m.group(1))
-            new_lineno = int(m.group(3))
+    for m in DIFF_LINE_REGEX.finditer(diff_text):
+        old_start, new_start, kind, text = m.groups()
+        if old_start is not None:
+            old_lineno = int(old_start)
+            new_lineno = int(new_start)
             continue
 
-        if line.startswith("---") or line.startswith("+++"):
+        if old_lineno is None:
+            # not inside a hunk yet
+            continue
+        if kind != b" " and text[:2] == kind * 2:
             # skip file headers
             continue
 
-        if old_lineno is None or new_lineno is None:
-            # not inside a hunk yet
-            continue
+        yield kind, old_lineno, new_lineno, text
+        if kind != b"+":
+            old_lineno += 1
+        if kind != b"-":
+            new_lineno += 1
 
-        prefix = line[0]
-        text = line[1:] if len(line) else ""
 
-        if prefix == " ":
+def parse_diff(diff_text: str | bytes | None) -> list[DiffChange]:
+    changes = []
+    for kind, old_lineno, new_lineno, text in _iter_diff_lines(diff_text):
+        text = text.decode("utf-8", errors="replace")
+        if kind == b" ":
             changes.append(
                 DiffChange(old_lineno, new_lineno, DiffChangeType.BLANK, text)
             )
-            old_lineno += 1
-            new_lineno += 1
-        elif prefix == "+":
+        elif kind == b"+":
             changes.append(
                 DiffChange(None, new_lineno, DiffChangeType.ADD, text)
             )
-            new_lineno += 1
-        elif prefix == "-":
+        else:
             changes.append(
                 DiffChange(old_lineno, None, DiffChangeType.REMOVE, text)
             )
-            old_lineno += 1
-        else:
-            # e.g. "\ No newline at end of file"
-            pass
     return changes
 
 
@@ -91,22 +104,29 @@ def process_changes(changes: list[DiffChange]) -> set[int]:
             # whitespace or blank line
             continue
 
-        lineno = next(
-            (
-                item
-                for item in [change.new_lineno, change.old_lineno]
-                if item is not None
-            ),
-            -1,
-        )
-        if lineno == -1:
-            raise
-        lines.add(lineno)
+        # added lines carry their new number, removed ones their old one
+        if change.new_lineno is not None:
+            lines.add(change.new_lineno)
+        else:
+            lines.add(change.old_lineno)
+    return lines
+
+
+def diff_to_linenos(diff_text: str | bytes | None) -> set[int]:
+    """Line numbers of the non-blank lines added or removed by a patch, the
+    same as `process_changes(parse_diff(diff_text))` without building a
+    `DiffChange` per line."""
+    lines = set()
+    for kind, old_lineno, new_lineno, text in _iter_diff_lines(diff_text):
+        if kind == b" " or not text.strip():
+            # context, whitespace or blank line
+            continue
+        lines.add(new_lineno if kind == b"+" else old_lineno)
     return lines
 
 
 def process_git_diff(diff: Diff) -> set[int]:
-    return process_changes(parse_diff(diff.diff))
+    return diff_to_linenos(diff.diff)
 
 
 def get_change_type(diff: Diff) -> ChangeType:
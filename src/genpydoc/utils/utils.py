@@ -1,14 +1,27 @@
-from os.path import commonprefix
 from pathlib import Path
+import functools
+import logging
 import os
-import tomllib
 from typing import Any, Sequence
 
 import click
 from click import Context, Parameter
 
+logger = logging.getLogger(__name__)
 
-def find_project_root(srcs: list[str]) -> Path:
+# option names of the configuration file are spelt with hyphens
+_HYPHEN_TO_UNDERSCORE = str.maketrans("-", "_")
+
+
+def find_project_root(srcs: Sequence[str]) -> Path:
+    """Closest parent of the sources holding a `.git` directory or a
+    pyproject.toml. The lookup is memoized, as it stats every parent; the
+    working directory is part of the key since the sources may be relative."""
+    return _find_project_root(tuple(srcs), os.getcwd())
+
+
+@functools.lru_cache(maxsize=128)
+def _find_project_root(srcs: tuple[str, ...], _cwd: str) -> Path:
     if not srcs:
         return Path("/").resolve()
     common_base = min(Path(src).resolve() for src in srcs)
@@ -24,11 +37,21 @@ def find_project_root(srcs: list[str]) -> Path:
     return directory
 
 
-def parse_pyproject_toml(path_config: str) -> dict[str, Any] | None:
+def parse_pyproject_toml(path_config: str) -> dict[str, Any]:
+    """Read the `[tool.genpydoc]` table of a pyproject.toml; the result is
+    reused as long as the file is not modified."""
+    mtime_ns = os.stat(path_config).st_mtime_ns
+    return dict(_parse_pyproject_toml(str(path_config), mtime_ns))
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_pyproject_toml(path_config: str, _mtime_ns: int) -> dict[str, Any]:
+    import tomllib
+
     with open(path_config, "rb") as file:
         toml = tomllib.load(file)
-    config = toml.get("tool", {}).get("genpydoc")
-    return {k.replace("-", "_"): v for k, v in config.items()}
+    config = toml.get("tool", {}).get("genpydoc") or {}
+    return {k.translate(_HYPHEN_TO_UNDERSCORE): v for k, v in config.items()}
 
 
 def read_config_file(
@@ -42,9 +65,13 @@ def read_config_file(
         if value is None:
             return None
 
-    print(f"{value=}")
+    logger.debug("using configuration file %s", value)
+
+    config = {}
+    if Path(value).suffix == ".toml":
+        # only loaded when there is a configuration file to read
+        import tomllib
 
-    if value.suffix == ".toml":
         try:
             config = parse_pyproject_toml(value)
         except (tomllib.TOMLDecodeError, OSError) as err:
@@ -70,7 +97,13 @@ def find_project_config(path_search_start: Sequence[str]) -> str | None:
 
 
 def get_common_base(files: list[str]) -> str:
-    commonbase = Path(commonprefix(files))
-    while not commonbase.exists():
-        commonbase = commonbase.parent
-    return str(commonbase)
+    try:
+        commonbase = os.path.commonpath(files)
+    except ValueError:
+        # a mix of absolute and relative paths
+        commonbase = os.path.commonpath(
+            [os.path.abspath(file) for file in files]
+        )
+    while commonbase and not os.path.isdir(commonbase):
+        commonbase = os.path.dirname(commonbase)
+    return commonbase or os.curdir
@@ -0,0 +1,48 @@
+import os
+
+from genpydoc.commenter.cache import PromptCache
+from genpydoc.config.config import Config
+from genpydoc.extractor.cache import NodeCache
+
+
+def test_stamp_ignores_options_the_extractor_does_not_read(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text("def f():\n    pass\n")
+    stamp = NodeCache.stamp(path, Config())
+    assert stamp == NodeCache.stamp(path, Config(use_model="other", qpm=1))
+    assert stamp != NodeCache.stamp(path, Config(ignore_private=True))
+
+
+def test_entry_is_overwritten_when_the_file_changes(tmp_path):
+    cache = NodeCache(tmp_path / "cache")
+    path = tmp_path / "module.py"
+    path.write_text("def f():\n    pass\n")
+    stamp = NodeCache.stamp(path, Config())
+    cache.set(path, stamp, ["old"])
+    assert cache.get(path, stamp) == ["old"]
+    path.write_text("def g():\n    pass\n\n")
+    new_stamp = NodeCache.stamp(path, Config())
+    assert cache.get(path, new_stamp) is NodeCache.MISSING
+    cache.set(path, new_stamp, ["new"])
+    assert cache.get(path, new_stamp) == ["new"]
+    assert len(list(cache.path.iterdir())) == 1
+
+
+def test_old_entries_are_purged_on_open(tmp_path):
+    cache = NodeCache(tmp_path / "cache")
+    path = tmp_path / "module.py"
+    path.write_text("")
+    cache.set(path, NodeCache.stamp(path, Config()), [])
+    (entry,) = cache.path.iterdir()
+    os.utime(entry, (0, 0))
+    NodeCache(cache.path, ttl_days=30)
+    assert not entry.exists()
+
+
+def test_prompt_responses_are_stored_in_one_transaction(tmp_path):
+    cache = PromptCache(tmp_path / "cache.sqlite")
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    cache.set_many([("a", "A"), ("b", "B")])
+    assert statements.count("COMMIT") == 1
+    assert cache.get("a") == "A" and cache.get("b") == "B"
@@ -0,0 +1,71 @@
+import ast
+import textwrap
+
+from genpydoc.commenter import transformer
+from genpydoc.commenter.transformer import Parser, Transformer, apply_edits
+from genpydoc.config.config import Config
+
+
+def transform(source: str, comments: dict[str, str]) -> str:
+    data = textwrap.dedent(source).encode()
+    transformer = Transformer(comments=comments, source=data)
+    transformer.visit(ast.parse(data))
+    return apply_edits(data, transformer.edits).decode()
+
+
+def test_docstring_goes_before_decorators_of_first_member():
+    result = transform(
+        """\
+        class Point:
+            @property
+            @staticmethod
+            def x(self):
+                return 0
+        """,
+        {"Point": "A point."},
+    )
+    ast.parse(result)
+    assert result == textwrap.dedent('''\
+        class Point:
+            """A point."""
+            @property
+            @staticmethod
+            def x(self):
+                return 0
+        ''')
+
+
+def test_docstring_of_decorated_nested_class():
+    result = transform(
+        """\
+        def outer():
+            @decorator(
+                arg,
+            )
+            class Inner:
+                pass
+        """,
+        {"outer": "Outer."},
+    )
+    tree = ast.parse(result)
+    assert ast.get_docstring(tree.body[0]) == "Outer."
+
+
+def test_process_keeps_the_declared_encoding(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_bytes(
+        "# -*- coding: latin-1 -*-\ndef f():\n    return 'café'\n".encode(
+            "latin-1"
+        )
+    )
+    Parser(config=Config()).process(path, {"f": "Café — done."})
+    tree = ast.parse(path.read_bytes())
+    assert ast.get_docstring(tree.body[0]) == "Café — done."
+    assert "return 'café'" in path.read_bytes().decode("latin-1")
+
+
+def test_cleanup_without_black_leaves_the_source(monkeypatch, tmp_path):
+    monkeypatch.setattr(transformer, "black", None)
+    source = b"x  =  1\n"
+    parser = Parser(config=Config())
+    assert parser.cleanup(tmp_path / "module.py", source) == source